@@ -4,6 +4,7 @@ use crate::parse_pdf::{DayEntry, ParsedPdf, StatLine};
 use crate::{daylio, merge, Daylio};
 use chrono::{Datelike, NaiveDateTime, NaiveTime, Timelike};
 use color_eyre::Result;
+use std::collections::HashMap;
 
 #[derive(Debug, PartialEq, Clone, Default)]
 struct ProcessedDayEntry {
@@ -157,7 +158,7 @@ fn list_tags_and_moods(parsed: &ParsedPdf) -> (Vec<Tag>, Vec<Mood>) {
 
     // sort moods according to the order they appear in the PDF
     let mut moods: Vec<Mood> = moods.into_iter().collect();
-    moods.sort_by_key(|mood| parsed.stats.iter().position(|stat| stat.name == mood.name));
+    moods.sort_by_cached_key(|mood| parsed.stats.iter().position(|stat| stat.name == mood.name));
     update_mood_category(&mut moods);
 
     (tags.into_iter().collect(), moods)
@@ -167,6 +168,10 @@ impl From<ParsedPdf> for ProcessedPdf {
     fn from(parsed: ParsedPdf) -> Self {
         let (tags, moods) = list_tags_and_moods(&parsed);
 
+        // names are unique, index them once instead of searching for each entry
+        let mood_ids: HashMap<&str, i64> = moods.iter().map(|x| (x.name.as_str(), x.id)).collect();
+        let tag_ids: HashMap<&str, i64> = tags.iter().map(|x| (x.name.as_str(), x.id)).collect();
+
         let day_entries = parsed
             .day_entries
             .into_iter()
@@ -174,11 +179,8 @@ impl From<ParsedPdf> for ProcessedPdf {
                 let date = parse_date(&entry).unwrap();
                 let (note, entry_tags) = extract_tags(&entry, &parsed.stats);
 
-                let entry_mood = moods.iter().find(|x| x.name == entry.mood).unwrap().id;
-                let entry_tags = entry_tags
-                    .iter()
-                    .map(|x| tags.iter().find(|y| y.name == *x).unwrap().id)
-                    .collect();
+                let entry_mood = mood_ids[entry.mood.as_str()];
+                let entry_tags = entry_tags.iter().map(|x| tag_ids[x.as_str()]).collect();
 
                 ProcessedDayEntry {
                     date,
@@ -1,36 +1,64 @@
 use crate::analyze_pdf::ProcessedPdf;
 use crate::Daylio;
-use base64::{engine::general_purpose::STANDARD as BASE64, Engine};
+use base64::engine::general_purpose::STANDARD as BASE64;
+use base64::read::DecoderReader;
+use base64::write::EncoderWriter;
 use color_eyre::eyre::{eyre, ContextCompat, WrapErr};
 use color_eyre::Result;
 use std::fs::File;
 use std::io::prelude::*;
-use std::io::Read;
+use std::io::{BufReader, BufWriter, IntoInnerError, Read};
 use std::path::Path;
 use zip::write::FileOptions;
 use zip::ZipWriter;
 
+/// Reader adapter dropping line breaks, which the base64 decoder does not accept
+struct SkipNewlines<R>(R);
+
+impl<R: Read> Read for SkipNewlines<R> {
+    fn read(&mut self, buf: &mut [u8]) -> std::io::Result<usize> {
+        loop {
+            let read = self.0.read(buf)?;
+            if read == 0 {
+                return Ok(0);
+            }
+
+            let mut len = 0;
+            for i in 0..read {
+                if buf[i] != b'\n' {
+                    buf[len] = buf[i];
+                    len += 1;
+                }
+            }
+
+            // a chunk made only of line breaks is not the end of the stream
+            if len > 0 {
+                return Ok(len);
+            }
+        }
+    }
+}
+
 pub fn load_daylio_backup(path: &Path) -> Result<Daylio> {
-    let file = File::open(path)?;
+    let file = BufReader::new(File::open(path)?);
 
     let mut archive = zip::ZipArchive::new(file)?;
-    let mut file = archive.by_name("backup.daylio")?;
+    let file = archive.by_name("backup.daylio")?;
+    let encoded_size = file.size() as usize;
 
-    let mut data = String::new();
-    file.read_to_string(&mut data)?;
-    data = data.replace('\n', "");
-
-    let data = BASE64.decode(data)?;
+    // decode while reading, so the base64 text is never fully held in memory
+    let mut decoder = DecoderReader::new(SkipNewlines(file), &BASE64);
+    let mut data = Vec::with_capacity(encoded_size / 4 * 3);
+    decoder.read_to_end(&mut data)?;
 
     serde_json::from_slice(&data).wrap_err("Failed to parse Daylio backup")
 }
 
 pub fn load_daylio_json(path: &Path) -> Result<Daylio> {
-    let mut file = File::open(path)?;
-    let mut data = String::new();
-    file.read_to_string(&mut data)?;
+    // serde_json validates UTF-8 itself, no need for an intermediate String
+    let data = std::fs::read(path)?;
 
-    serde_json::from_str(&data).wrap_err("Failed to parse Daylio JSON")
+    serde_json::from_slice(&data).wrap_err("Failed to parse Daylio JSON")
 }
 
 pub fn load_daylio_pdf(path: &Path) -> Result<Daylio> {
@@ -54,27 +82,35 @@ pub fn load_daylio(path: &Path) -> Result<Daylio> {
 }
 
 pub fn store_daylio_backup(daylio: &Daylio, path: &Path) -> Result<()> {
-    let file = File::create(path)?;
+    let file = BufWriter::new(File::create(path)?);
 
     let mut archive = ZipWriter::new(file);
+    // the app deflates its own backups, but imports stored ones just as well;
+    // skipping compression keeps writing cheap at the cost of a larger file
     let options = FileOptions::default().compression_method(zip::CompressionMethod::Stored);
 
-    let json = serde_json::to_string_pretty(daylio)?;
+    archive.start_file("backup.daylio", options)?;
 
-    let data = BASE64.encode(json.as_bytes());
+    // encode while serializing, so neither the JSON nor the base64 text is fully held in memory
+    // serde_json issues many tiny writes, so they are batched before reaching the encoder
+    let encoder = EncoderWriter::new(&mut archive, &BASE64);
+    let mut writer = BufWriter::with_capacity(64 * 1024, encoder);
+    // only the app reads this, and it writes compact JSON itself
+    serde_json::to_writer(&mut writer, daylio)?;
+    writer
+        .into_inner()
+        .map_err(IntoInnerError::into_error)?
+        .finish()?;
 
-    archive.start_file("backup.daylio", options)?;
-    archive.write_all(data.as_bytes())?;
-    archive.finish()?;
+    archive.finish()?.flush()?;
 
     Ok(())
 }
 
 pub fn store_daylio_json(daylio: &Daylio, path: &Path) -> Result<()> {
-    let json = serde_json::to_string_pretty(daylio)?;
-
-    let mut file = File::create(path)?;
-    file.write_all(json.as_bytes())?;
+    let mut file = BufWriter::new(File::create(path)?);
+    serde_json::to_writer_pretty(&mut file, daylio)?;
+    file.flush()?;
 
     Ok(())
 }
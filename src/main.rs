@@ -1,7 +1,9 @@
 use color_eyre::eyre::{ContextCompat, Result};
-use daylio_tools::{load_daylio, merge, store_daylio_backup, store_daylio_json};
+use daylio_tools::{load_daylio, merge, store_daylio_backup, store_daylio_json, Daylio};
 use std::env;
+use std::panic;
 use std::path::PathBuf;
+use std::thread;
 
 enum Command {
     Merge {
@@ -94,12 +96,36 @@ fn main() -> Result<()> {
 
     match command {
         Command::Merge { input, output } => {
-            let mut daylio = load_daylio(&input[0])?;
+            // the first two files are loaded together, then the next file is loaded
+            // while the current one is merged, so at most three are in memory
+            let daylio = thread::scope(|scope| -> Result<Daylio> {
+                let mut paths = input.iter().skip(1);
+                let mut loading = paths
+                    .next()
+                    .map(|path| scope.spawn(move || load_daylio(path)));
 
-            for path in input.iter().skip(1) {
-                let other = load_daylio(path)?;
-                daylio = merge(daylio, other);
-            }
+                let mut daylio = match load_daylio(&input[0]) {
+                    Ok(daylio) => daylio,
+                    Err(e) => {
+                        // joined here, so a panic in the other load does not hide this error
+                        if let Some(handle) = loading {
+                            let _ = handle.join();
+                        }
+                        return Err(e);
+                    }
+                };
+
+                while let Some(handle) = loading {
+                    let other = handle.join().unwrap_or_else(|e| panic::resume_unwind(e))?;
+                    // spawned only once this load succeeded, so an error leaves no thread behind
+                    loading = paths
+                        .next()
+                        .map(|path| scope.spawn(move || load_daylio(path)));
+                    daylio = merge(daylio, other);
+                }
+
+                Ok(daylio)
+            })?;
             store_daylio_backup(&daylio, &output)?;
         }
         Command::Anonymize { input, output } => {
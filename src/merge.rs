@@ -1,29 +1,8 @@
 use crate::daylio::{CustomMood, Daylio, Tag};
 use crate::DayEntry;
-
-#[derive(Clone, Copy)]
-struct IdGenerator {
-    offset: i64,
-    current: i64,
-}
-
-impl IdGenerator {
-    fn new(offset: i64) -> Self {
-        Self::with_start(offset, offset)
-    }
-
-    fn with_start(offset: i64, start: i64) -> Self {
-        Self {
-            offset,
-            current: start - offset,
-        }
-    }
-
-    fn next(&mut self) -> i64 {
-        self.current += self.offset;
-        self.current
-    }
-}
+use fnv::{FnvHashMap, FnvHashSet};
+use std::collections::hash_map::Entry;
+use std::mem;
 
 trait ProjectEq<T> {
     fn project(&self) -> T;
@@ -54,76 +33,144 @@ impl PartialEq for Tag {
 }
 
 impl Daylio {
-    fn change_mood_id(day_entries: &mut [DayEntry], mood: &mut CustomMood, new_id: i64) {
-        for entry in day_entries {
-            if entry.mood == mood.id {
-                entry.mood = new_id;
+    fn remap_entry(
+        entry: &mut DayEntry,
+        mood_ids: &FnvHashMap<i64, i64>,
+        tag_ids: &FnvHashMap<i64, i64>,
+    ) {
+        if let Some(&new_id) = mood_ids.get(&entry.mood) {
+            entry.mood = new_id;
+        }
+
+        if tag_ids.is_empty() {
+            return;
+        }
+
+        for tag in entry.tags.iter_mut() {
+            if let Some(&new_id) = tag_ids.get(tag) {
+                *tag = new_id;
             }
         }
-        mood.id = new_id
+
+        // duplicate tags may now share an id, only the first occurrence is kept
+        let mut len = 0;
+        for i in 0..entry.tags.len() {
+            let tag = entry.tags[i];
+            if !entry.tags[..len].contains(&tag) {
+                entry.tags[len] = tag;
+                len += 1;
+            }
+        }
+        entry.tags.truncate(len);
     }
 
-    fn change_tag_id(day_entries: &mut [DayEntry], tag: &mut Tag, new_id: i64) {
+    /// Applies the given id changes to every entry, in a single pass
+    fn remap_entries(
+        day_entries: &mut [DayEntry],
+        mood_ids: &FnvHashMap<i64, i64>,
+        tag_ids: &FnvHashMap<i64, i64>,
+    ) {
+        // common case when merging files without duplicates
+        if mood_ids.is_empty() && tag_ids.is_empty() {
+            return;
+        }
+
         for entry in day_entries {
-            for i in 0..entry.tags.len() {
-                if entry.tags[i] == tag.id {
-                    entry.tags[i] = new_id;
-                    break;
-                }
-            }
+            Daylio::remap_entry(entry, mood_ids, tag_ids);
         }
-        tag.id = new_id;
     }
 
-    fn make_ids_distinct(&mut self, gen: &mut IdGenerator) {
+    /// Largest mood or tag id, including the ones referenced by entries
+    fn max_id(&self) -> i64 {
+        let moods = self.custom_moods.iter().map(|mood| mood.id);
+        let tags = self.tags.iter().map(|tag| tag.id);
+        let references = self
+            .day_entries
+            .iter()
+            .flat_map(|entry| entry.tags.iter().copied().chain([entry.mood]));
+
+        moods.chain(tags).chain(references).max().unwrap_or(0)
+    }
+
+    /// Shifts every mood and tag id, along with the references to them.
+    /// References to unknown ids are left as they are
+    fn offset_ids(&mut self, offset: i64) {
+        let mut mood_ids =
+            FnvHashSet::with_capacity_and_hasher(self.custom_moods.len(), Default::default());
         for mood in &mut self.custom_moods {
-            Daylio::change_mood_id(&mut self.day_entries, mood, gen.next());
+            mood_ids.insert(mood.id);
+            mood.id += offset;
         }
 
+        let mut tag_ids = FnvHashSet::with_capacity_and_hasher(self.tags.len(), Default::default());
         for tag in &mut self.tags {
-            Daylio::change_tag_id(&mut self.day_entries, tag, gen.next());
+            tag_ids.insert(tag.id);
+            tag.id += offset;
         }
-    }
 
-    fn remove_duplicates(&mut self) {
-        // for moods
-        self.custom_moods.sort_by_key(ProjectEq::project);
-
-        for i in 1..self.custom_moods.len() {
-            if self.custom_moods[i - 1] == self.custom_moods[i] {
-                let new_id = self.custom_moods[i - 1].id;
-                Daylio::change_mood_id(&mut self.day_entries, &mut self.custom_moods[i], new_id);
-                self.custom_moods[i].id = -1; // mark for deletion
+        for entry in &mut self.day_entries {
+            if mood_ids.contains(&entry.mood) {
+                entry.mood += offset;
+            }
+            for tag in entry.tags.iter_mut() {
+                if tag_ids.contains(tag) {
+                    *tag += offset;
+                }
             }
         }
+    }
 
-        self.custom_moods.retain(|mood| mood.id != -1);
+    fn remove_duplicates(&mut self) {
+        // the first of each group of duplicates is kept, the others are mapped to it
+        // for moods
+        let mut canonical_ids =
+            FnvHashMap::with_capacity_and_hasher(self.custom_moods.len(), Default::default());
+        let mut mood_ids = FnvHashMap::default();
+        self.custom_moods
+            .retain(|mood| match canonical_ids.entry(mood.project()) {
+                Entry::Occupied(canonical) => {
+                    mood_ids.insert(mood.id, *canonical.get());
+                    false
+                }
+                Entry::Vacant(slot) => {
+                    slot.insert(mood.id);
+                    true
+                }
+            });
 
         // for tags
-        self.tags.sort_by_key(ProjectEq::project);
-
-        for i in 1..self.tags.len() {
-            if self.tags[i - 1] == self.tags[i] {
-                let new_id = self.tags[i - 1].id;
-                Daylio::change_tag_id(&mut self.day_entries, &mut self.tags[i], new_id);
-                self.tags[i].id = -1; // mark for deletion
-            }
-        }
+        let mut canonical_ids =
+            FnvHashMap::with_capacity_and_hasher(self.tags.len(), Default::default());
+        let mut tag_ids = FnvHashMap::default();
+        self.tags
+            .retain(|tag| match canonical_ids.entry(tag.project()) {
+                Entry::Occupied(canonical) => {
+                    tag_ids.insert(tag.id, *canonical.get());
+                    false
+                }
+                Entry::Vacant(slot) => {
+                    slot.insert(tag.id);
+                    true
+                }
+            });
 
-        self.tags.retain(|tag| tag.id != -1);
+        Daylio::remap_entries(&mut self.day_entries, &mood_ids, &tag_ids);
 
         // for entries
-        self.day_entries
-            .sort_by_key(|x| (x.datetime, x.year, x.month));
-
-        for i in 1..self.day_entries.len() {
-            // we do not want to lose any data, so they need to be exactly the same
-            if self.day_entries[i - 1] == self.day_entries[i] {
-                self.day_entries[i].id = -1; // mark for deletion
+        // we do not want to lose any data, so they need to be exactly the same
+        // only entries at the same time can be equal, so they are grouped by datetime
+        let mut kept_at: FnvHashMap<i64, Vec<usize>> =
+            FnvHashMap::with_capacity_and_hasher(self.day_entries.len(), Default::default());
+        let mut kept = Vec::with_capacity(self.day_entries.len());
+        for entry in mem::take(&mut self.day_entries) {
+            let same_time = kept_at.entry(entry.datetime).or_default();
+            if !same_time.iter().any(|&i| kept[i] == entry) {
+                same_time.push(kept.len());
+                kept.push(entry);
             }
         }
 
-        self.day_entries.retain(|entry| entry.id != -1);
+        self.day_entries = kept;
     }
 
     pub fn sanitize(&mut self) {
@@ -137,22 +184,32 @@ impl Daylio {
         }
 
         // predefined moods have to have the same id as the predefined name
+        let mut mood_ids =
+            FnvHashMap::with_capacity_and_hasher(self.custom_moods.len(), Default::default());
         for mood in self.custom_moods.iter_mut() {
             if mood.predefined_name_id != -1 {
-                Daylio::change_mood_id(&mut self.day_entries, mood, mood.predefined_name_id);
+                mood_ids.insert(mood.id, mood.predefined_name_id);
+                mood.id = mood.predefined_name_id;
             }
         }
 
-        // we start at 6 because the first 5 predefined moods are reserved
-        let mut id_generator = IdGenerator::with_start(1, 6);
-
         // order is important, so we need to sort by mood_group_id and predefined comes first
-        self.custom_moods
-            .sort_by_key(|x| (x.mood_group_id, -x.predefined_name_id));
-        for mood in self.custom_moods.iter_mut() {
-            if mood.predefined_name_id == -1 {
-                Daylio::change_mood_id(&mut self.day_entries, mood, id_generator.next());
-            }
+        // ties are broken by name, so the order does not depend on the input order
+        self.custom_moods.sort_by_cached_key(|x| {
+            (
+                x.mood_group_id,
+                -x.predefined_name_id,
+                x.custom_name.to_lowercase(),
+            )
+        });
+        // we start at 6 because the first 5 predefined moods are reserved
+        let custom_moods = self
+            .custom_moods
+            .iter_mut()
+            .filter(|mood| mood.predefined_name_id == -1);
+        for (mood, new_id) in custom_moods.zip(6..) {
+            mood_ids.insert(mood.id, new_id);
+            mood.id = new_id;
         }
 
         // each mood group has an order, so we need to update it
@@ -167,36 +224,36 @@ impl Daylio {
             }
         }
 
-        self.tags.sort_by_key(|x| x.created_at);
-        let mut id_generator = IdGenerator::new(1);
-        for (i, mut tag) in self.tags.iter_mut().enumerate() {
-            Daylio::change_tag_id(&mut self.day_entries, tag, id_generator.next());
-            tag.order = i as i64 + 1;
+        self.tags
+            .sort_by_cached_key(|x| (x.created_at, x.name.to_lowercase()));
+        let mut tag_ids = FnvHashMap::with_capacity_and_hasher(self.tags.len(), Default::default());
+        for (tag, new_id) in self.tags.iter_mut().zip(1..) {
+            tag_ids.insert(tag.id, new_id);
+            tag.id = new_id;
+            tag.order = new_id;
         }
 
-        self.day_entries
-            .sort_by_key(|x| (-x.datetime, -x.year, -x.month));
-        let mut id_generator = IdGenerator::new(1);
-        for entry in self.day_entries.iter_mut() {
-            entry.id = id_generator.next();
+        self.day_entries.sort_by_key(|x| -x.datetime);
+
+        // apply the new mood and tag ids while numbering the entries
+        for (entry, new_id) in self.day_entries.iter_mut().zip(1..) {
+            entry.id = new_id;
+            Daylio::remap_entry(entry, &mood_ids, &tag_ids);
         }
     }
 }
 
-pub fn merge(mut daylio1: Daylio, mut daylio2: Daylio) -> Daylio {
-    const BIG_OFFSET: u64 = 1000;
-
+pub fn merge(daylio1: Daylio, mut daylio2: Daylio) -> Daylio {
     // first_pass: make sure we don't have any duplicates id
-    let mut id_generator = IdGenerator::new(BIG_OFFSET as i64);
-    daylio1.make_ids_distinct(&mut id_generator);
-    daylio2.make_ids_distinct(&mut id_generator);
+    // the shifted ids must also stay clear of what daylio2 references without defining
+    let offset = daylio1.max_id().max(daylio2.max_id()) + 1;
+    daylio2.offset_ids(offset);
 
+    // both inputs are owned, so their lists can be moved instead of cloned
     let mut merged = daylio1;
-    merged
-        .custom_moods
-        .append(&mut daylio2.custom_moods.clone());
-    merged.tags.append(&mut daylio2.tags.clone());
-    merged.day_entries.append(&mut daylio2.day_entries.clone());
+    merged.custom_moods.append(&mut daylio2.custom_moods);
+    merged.tags.append(&mut daylio2.tags);
+    merged.day_entries.append(&mut daylio2.day_entries);
 
     merged.remove_duplicates();
     merged.sanitize();
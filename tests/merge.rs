@@ -151,12 +151,9 @@ mod tests {
         input
     }
 
-    #[test]
-    fn merge_with_empty_do_not_change() -> Result<()> {
-        let input1 = input1();
-        let input2 = Daylio::default();
-
-        let mut expected = input1.clone();
+    /// input1 once merged: tags are renumbered, everything else is kept
+    fn expected1() -> Daylio {
+        let mut expected = input1();
 
         expected.tags = vec![
             Tag {
@@ -191,9 +188,82 @@ mod tests {
                 .collect();
         }
 
+        expected
+    }
+
+    #[test]
+    fn merge_with_empty_do_not_change() -> Result<()> {
+        let merged = merge(input1(), Daylio::default());
+
+        assert_eq!(merged, expected1());
+
+        Ok(())
+    }
+
+    #[test]
+    fn merge_into_empty_do_not_change() -> Result<()> {
+        // input1 has an entry referencing mood 8, which it does not define
+        let merged = merge(Daylio::default(), input1());
+
+        assert_eq!(merged, expected1());
+
+        Ok(())
+    }
+
+    #[test]
+    fn equal_entries_at_same_time_are_merged() -> Result<()> {
+        let entry = |id: i64, note: &str| DayEntry {
+            id,
+            datetime: 1659481200000,
+            mood: 1,
+            note: note.to_owned(),
+            ..Default::default()
+        };
+
+        let input1 = Daylio {
+            day_entries: vec![entry(1, "same"), entry(2, "other")],
+            ..Daylio::default()
+        };
+        let input2 = Daylio {
+            day_entries: vec![entry(1, "same")],
+            ..Daylio::default()
+        };
+
         let merged = merge(input1, input2);
 
-        assert_eq!(merged, expected);
+        let notes: Vec<&str> = merged
+            .day_entries
+            .iter()
+            .map(|entry| entry.note.as_str())
+            .collect();
+        assert_eq!(notes, ["same", "other"]);
+
+        Ok(())
+    }
+
+    #[test]
+    fn merge_with_itself_removes_duplicates() -> Result<()> {
+        let merged = merge(input1(), input1());
+
+        assert_eq!(merged, expected1());
+
+        Ok(())
+    }
+
+    #[test]
+    fn merged_tags_are_not_repeated_in_entries() -> Result<()> {
+        let mut input = input1();
+        input.tags[1].name = "TAG1".to_owned(); // same tag as "tag1"
+
+        let merged = merge(input, Daylio::default());
+
+        assert_eq!(merged.tags.len(), 1);
+        let tags: Vec<&[i64]> = merged
+            .day_entries
+            .iter()
+            .map(|entry| entry.tags.as_slice())
+            .collect();
+        assert_eq!(tags, [[1], [1], [1]]);
 
         Ok(())
     }